@@ -4,11 +4,9 @@ from aws_cdk import core
 from aws_newrelease_slack.aws_newrelease_slack_stack import AwsNewreleaseSlackStack
 
 app = core.App()
-dev_new_releases_stack = AwsNewreleaseSlackStack(app, 'aws-newrelease-slack-dev')
-core.Tags.of(dev_new_releases_stack).add('Project', 'AWS New Releases Chatbot')
-core.Tags.of(dev_new_releases_stack).add('Environment', 'Dev')
-
-prod_new_releases_stack = AwsNewreleaseSlackStack(app, 'aws-newrelease-slack-prod')
-core.Tags.of(prod_new_releases_stack).add('Project', 'AWS New Releases Chatbot')
-core.Tags.of(prod_new_releases_stack).add('Environment', 'Prod')
+# Only synthesize the environment being deployed, e.g. cdk deploy -c env=prod
+env = app.node.try_get_context('env') or 'dev'
+new_releases_stack = AwsNewreleaseSlackStack(app, f'aws-newrelease-slack-{env}')
+core.Tags.of(new_releases_stack).add('Project', 'AWS New Releases Chatbot')
+core.Tags.of(new_releases_stack).add('Environment', env.capitalize())
 app.synth()
@@ -1,11 +1,15 @@
-from aws_cdk import core as cdk
-from aws_cdk import aws_dynamodb as dynamodb
-from aws_cdk import aws_events as events
-from aws_cdk import aws_events_targets as events_targets
-from aws_cdk import aws_lambda as lambda_
-from aws_cdk import aws_lambda_python as lambda_python
-from aws_cdk import aws_logs as logs
-from aws_cdk import aws_secretsmanager as secretsmanager
+import hashlib
+
+from aws_cdk import (
+    core as cdk,
+    aws_dynamodb as dynamodb,
+    aws_events as events,
+    aws_events_targets as events_targets,
+    aws_lambda as lambda_,
+    aws_lambda_python as lambda_python,
+    aws_logs as logs,
+    aws_secretsmanager as secretsmanager,
+)
 
 
 class AwsNewreleaseSlackStack(cdk.Stack):
@@ -13,19 +17,13 @@ class AwsNewreleaseSlackStack(cdk.Stack):
     def __init__(self, scope: cdk.Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
-        """Default values if not specified via context variables from CLI
-        logging_level = 'INFO'
-        slack_webhook_secret_name = 'aws-to-slack/dev/webhooks'
-        """
-        if self.node.try_get_context('logging_level') is None:
-            LOGGING_LEVEL = 'INFO'
-        else:
-            LOGGING_LEVEL = self.node.try_get_context('logging_level')
-        if self.node.try_get_context('slack_webhook_secret_name') is None:
-            WEBHOOK_SECRET_NAME = 'aws-to-slack/dev/webhooks'
-        else:
-            WEBHOOK_SECRET_NAME = self.node.try_get_context(
-                'slack_webhook_secret_name')
+        """Default values if not specified via context variables from CLI"""
+        LOGGING_LEVEL = self._get_context('logging_level', 'INFO')
+        WEBHOOK_SECRET_NAME = self._get_context(
+            'slack_webhook_secret_name', 'aws-to-slack/dev/webhooks')
+        PROVISIONED_CONCURRENCY = self._get_context('provisioned_concurrency', 1)
+        SCHEDULE_MINUTES = self._get_context('schedule_minutes', 15)
+        MEMORY_SIZE = self._get_context('memory_size', 1024)
 
         """Create CloudFormation parameters so we can easily use the
         template this CDK app generates and convert it to a SAM
@@ -62,16 +60,60 @@ class AwsNewreleaseSlackStack(cdk.Stack):
             allowed_values=['INFO', 'ERROR', 'DEBUG', 'WARN'],
             default=LOGGING_LEVEL,
         ).value_as_string
+        provisioned_concurrency = cdk.CfnParameter(
+            self, 'ProvisionedConcurrency',
+            description=('The number of execution environments kept initialized '
+                         'for the scheduled invocation. Set to 0 to disable'),
+            type='Number',
+            default=PROVISIONED_CONCURRENCY,
+            min_value=0
+        )
+        schedule_minutes = cdk.CfnParameter(
+            self, 'ScheduleMinutes',
+            description='How often, in minutes, to check for new releases',
+            type='Number',
+            default=SCHEDULE_MINUTES,
+            min_value=2
+        ).value_as_string
+        memory_size = cdk.CfnParameter(
+            self, 'MemorySize',
+            description=('The memory, in MB, of the Lambda function. CPU is '
+                         'allocated in proportion to memory, so more memory '
+                         'shortens the parsing and startup work of each run'),
+            type='Number',
+            default=MEMORY_SIZE,
+            min_value=256,
+            max_value=3008
+        ).value_as_number
 
         """DynamoDB table which stores a history of messages sent"""
         ddb_table = dynamodb.Table(
             self, 'SlackMessageHistory',
             partition_key=dynamodb.Attribute(
                 name='url', type=dynamodb.AttributeType.STRING),
-            read_capacity=1,
-            write_capacity=1
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
         )
 
+        """The alias below points at a published version, and CloudFormation
+        only publishes a new one when the version itself changes. CDK sees
+        every parameter as the same Ref, so the parameter values are put in
+        the version description to publish a new version whenever one of
+        them changes. The feed urls don't fit in the 256 character limit of
+        the description, so a digest of the values from context is used.
+        Changing only the feed parameters at deploy time therefore doesn't
+        publish a new version; see the README.
+        """
+        feed_digest = hashlib.sha256(' '.join([
+            self.node.try_get_context('whats_new_rss_feed'),
+            self.node.try_get_context('whats_new_search_api')
+        ]).encode('utf-8')).hexdigest()[:12]
+        version_description = cdk.Fn.join(' ', [
+            logging_level,
+            webhook_secret_name_param,
+            cdk.Token.as_string(memory_size),
+            feed_digest
+        ])
+
         """Lambda function that queries the AWS What's New RSS feed
         and sends each release to Slack if it has not already been sent.
         """
@@ -90,11 +132,38 @@ class AwsNewreleaseSlackStack(cdk.Stack):
                 LOG_LEVEL=logging_level,
                 POWERTOOLS_SERVICE_NAME='aws-to-slack'
             ),
-            memory_size=512,
+            memory_size=memory_size,
             tracing=lambda_.Tracing.ACTIVE,
             timeout=cdk.Duration.seconds(30),
-            log_retention=logs.RetentionDays.SIX_MONTHS
+            log_retention=logs.RetentionDays.SIX_MONTHS,
+            current_version_options=lambda_.VersionOptions(
+                description=version_description
+            )
+        )
+        """Publishes the function behind a 'live' alias so that provisioned
+        concurrency can remove the cold start from each scheduled invocation.
+        The configuration is only added when ProvisionedConcurrency is not 0.
+        """
+        has_provisioned_concurrency = cdk.CfnCondition(
+            self, 'HasProvisionedConcurrency',
+            expression=cdk.Fn.condition_not(
+                cdk.Fn.condition_equals(
+                    provisioned_concurrency.value_as_string, '0'))
         )
+        new_release_alias = lambda_.Alias(
+            self, 'AWSReleasesFunctionAlias',
+            alias_name='live',
+            version=new_release_function.current_version
+        )
+        new_release_alias.node.default_child.add_property_override(
+            'ProvisionedConcurrencyConfig',
+            {'Fn::If': [
+                has_provisioned_concurrency.logical_id,
+                dict(ProvisionedConcurrentExecutions=provisioned_concurrency.value_as_number),
+                {'Ref': 'AWS::NoValue'}
+            ]}
+        )
+
         """Imports the SecretsManager secret which contains the Slack webhook url(s)
         and adds read access to the Lambda execution role
         """
@@ -108,13 +177,37 @@ class AwsNewreleaseSlackStack(cdk.Stack):
         rule = events.Rule(
             self, 'AWSReleaseToSlackRule',
             description='Schedule to invoke Lambda function that sends new AWS releases to Slack',
+            schedule=events.Schedule.expression(f'rate({schedule_minutes} minutes)')
+        )
+        rule.add_target(events_targets.LambdaFunction(new_release_alias))
+
+        """Keeps an execution environment warm between scheduled runs. The
+        function returns right away for these events. The rule is disabled
+        when provisioned concurrency already keeps an environment initialized.
+        """
+        warmer_rule = events.Rule(
+            self, 'AWSReleaseToSlackWarmerRule',
+            description='Schedule to keep the Lambda function that sends new AWS releases to Slack warm',
             schedule=events.Schedule.rate(cdk.Duration.minutes(5))
         )
-        rule.add_target(events_targets.LambdaFunction(new_release_function))
+        warmer_rule.add_target(events_targets.LambdaFunction(
+            new_release_alias,
+            event=events.RuleTargetInput.from_object(dict(warmer=True))
+        ))
+        warmer_rule.node.default_child.state = cdk.Fn.condition_if(
+            has_provisioned_concurrency.logical_id, 'DISABLED', 'ENABLED'
+        ).to_string()
 
-        """Grant the Lambda function Query and PutItem access to the DDB table"""
+        """Grant the Lambda function BatchGetItem and BatchWriteItem access to the DDB table"""
         ddb_table.grant(
             new_release_function,
-            'dynamodb:Query',
-            'dynamodb:PutItem'
+            'dynamodb:BatchGetItem',
+            'dynamodb:BatchWriteItem'
         )
+
+    def _get_context(self, key: str, default):
+        """Returns the context variable passed in from the CLI, or the
+        default if it was not specified
+        """
+        value = self.node.try_get_context(key)
+        return default if value is None else value
@@ -10,22 +10,27 @@ It then iterates over each article and checks if it exists in a DynamoDB
 table. If the url is not found, it will send a message to Slack with 
 the new release title, link, and description.
 
-The function is intended to run every 5 minutes. Since the feed doesn't 
+The function is intended to run every 15 minutes. Since the feed doesn't 
 change that often, when the script determines the url is already
 in DynamoDB it ignores it and moves on.
 """
 import boto3
-import feedparser
+import html
 import json
 import os
+import re
+import time
 import urllib3
 from aws_lambda_powertools import Logger
 from aws_lambda_powertools import Tracer
 from aws_lambda_powertools.utilities import parameters
-from bs4 import BeautifulSoup
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Key
+from email.utils import parsedate_to_datetime
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+from xml.etree import ElementTree
 
 logger = Logger()
 tracer = Tracer(patch_modules=['boto3', 'httplib'])
@@ -34,6 +39,62 @@ WHATS_NEW_RSS_FEED = os.environ['WHATS_NEW_RSS_FEED']
 WHATS_NEW_SEARCH_API = os.environ['WHATS_NEW_SEARCH_API']
 WEBHOOK_SECRET_NAME = os.environ['WEBHOOK_SECRET_NAME']
 DDB_TABLE = os.environ['DDB_TABLE']
+# BatchGetItem accepts at most 100 keys per request
+DDB_BATCH_GET_LIMIT = 100
+# BatchWriteItem accepts at most 25 put requests per request
+DDB_BATCH_WRITE_LIMIT = 25
+# Exponential backoff, in seconds, when a batch call returns unprocessed items
+DDB_RETRY_BASE_DELAY = 0.05
+DDB_RETRY_MAX_DELAY = 1
+# Requests made for a batch before giving up on its unprocessed items
+DDB_BATCH_MAX_ATTEMPTS = 5
+# Upper bound on the number of Slack webhooks posted to concurrently
+SLACK_MAX_WORKERS = 10
+# Number of sent urls remembered across warm invocations
+SLACKED_URLS_CACHE_SIZE = 5000
+# Seconds to keep the Slack webhook urls before fetching them again
+WEBHOOK_URLS_MAX_AGE = 14400
+# Matches the tags in the HTML summaries of each release
+HTML_TAG_PATTERN = re.compile(r'<[^>]+>')
+# Parts of the Slack message that are the same for every release. They
+# are shared between messages and must not be modified.
+SLACK_BUTTON_TEXT = dict(type='plain_text', text='Read More')
+SLACK_DIVIDER_BLOCK = dict(type='divider')
+
+# Created once per execution environment and reused by warm invocations
+# Adaptive retries rate limit the client when DDB throttles instead of
+# retrying immediately. A call gives up after 3 x (1 + 2) seconds at
+# most, well inside the 30 second function timeout.
+ddb_client = boto3.client('dynamodb', config=Config(
+    connect_timeout=1,
+    read_timeout=2,
+    retries=dict(mode='adaptive', max_attempts=3)
+))
+# GETs are retried on throttling and server errors, and no request can hang
+http_connection = urllib3.PoolManager(
+    maxsize=SLACK_MAX_WORKERS,
+    timeout=urllib3.Timeout(connect=2, read=5),
+    retries=urllib3.Retry(
+        total=2,
+        backoff_factor=0.2,
+        status_forcelist=[429, 500, 502, 503, 504]
+    )
+)
+# Slack posts are only retried when throttled so a message isn't sent twice.
+# A post that fails otherwise, such as on a connection Slack already
+# closed, isn't recorded as sent and is sent again on the next run.
+slack_retries = urllib3.Retry(
+    total=3,
+    read=0,
+    other=0,
+    backoff_factor=0.2,
+    status_forcelist=[429],
+    allowed_methods=['POST']
+)
+slacked_urls_cache = OrderedDict()
+webhook_urls_cache = dict(expires=0, urls=None)
+# Conditional request headers from the last fully processed response of each url
+conditional_headers = {}
 
 
 class NewRelease(object):
@@ -43,6 +104,8 @@ class NewRelease(object):
     are returned from the RSS feed.
     """
 
+    __slots__ = ('url', 'title', 'published_date', 'body')
+
     def __init__(self, url, title, published_date, body):
         self.url = url
         self.title = title
@@ -75,18 +138,13 @@ class NewRelease(object):
                     ),
                     accessory=dict(
                         type='button',
-                        text=dict(
-                            type='plain_text',
-                            text='Read More'
-                        ),
+                        text=SLACK_BUTTON_TEXT,
                         style='primary',
                         url=self.url,
                         action_id='button-link'
                     )
                 ),
-                dict(
-                    type='divider'
-                )
+                SLACK_DIVIDER_BLOCK
             ]
         )
         return message
@@ -97,19 +155,17 @@ class APINewRelease(NewRelease):
     from the search API
     """
 
+    __slots__ = ()
+
     def __init__(self, release):
-        self.url = f'https://aws.amazon.com{release["additionalFields"]["headlineUrl"]}'
-        self.title = release['additionalFields']['headline'].strip()
-        self.published_date = release['additionalFields']['postDateTime']
+        fields = release['additionalFields']
         try:
-            self.body = BeautifulSoup(
-                release['additionalFields']['postSummary'], 'html.parser').get_text()
+            body = strip_html(fields['postSummary'])
         except KeyError:
-            summary = BeautifulSoup(
-                release['additionalFields']['postBody'], 'html.parser').get_text()
-            self.body = summary.split('.')[0]
-        NewRelease.__init__(self, self.url, self.title,
-                            self.published_date, self.body)
+            summary = strip_html(fields['postBody'])
+            body = summary.split('.')[0]
+        NewRelease.__init__(self, f'https://aws.amazon.com{fields["headlineUrl"]}',
+                            fields['headline'].strip(), fields['postDateTime'], body)
 
     def __str__(self):
         return self.title
@@ -117,91 +173,239 @@ class APINewRelease(NewRelease):
 
 class RSSNewRelease(NewRelease):
     """Subclass of NewRelease that creates an object returned
-    from the RSS feed
+    from the RSS feed. The published date is expected to have already
+    been parsed into a datetime.
     """
 
+    __slots__ = ()
+
     def __init__(self, release):
-        self.url = release['link']
-        self.title = release['title']
-        self.published_date = datetime.strptime(
-            release['published'], '%a, %d %b %Y %H:%M:%S %z').isoformat().split('+')[0] + 'Z'
-        self.body = BeautifulSoup(
-            release['description'], 'html.parser').get_text()
-        NewRelease.__init__(self, self.url, self.title,
-                            self.published_date, self.body)
+        published_date = release['published'].astimezone(
+            timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        NewRelease.__init__(self, release['link'], release['title'],
+                            published_date, strip_html(release['description']))
 
     def __str__(self):
         return self.title
 
 
-def has_been_slacked(url):
-    """Returns true if the post ID is found in DDB table"""
-    logger.debug(f'Querying DDB for url = {url}')
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table(DDB_TABLE)
-    response = table.query(KeyConditionExpression=Key('url').eq(url))
-    if response['Count'] != 0:
-        return True
-    else:
-        return False
+def get_rss_releases():
+    """Returns the releases in the RSS feed that were published in the
+    last 12 hours, along with the headers that make the next request
+    conditional. Returns None if the feed hasn't changed since it was
+    last processed. The feed is parsed as it is read from the shared
+    connection pool, and since it lists the newest items first, parsing
+    stops at the first item older than that.
+    """
+    http_response = http_connection.request(
+        'GET', WHATS_NEW_RSS_FEED, preload_content=False,
+        headers=conditional_headers.get(WHATS_NEW_RSS_FEED, {}))
+    if http_response.status == 304:
+        http_response.release_conn()
+        return None
+    logger.info('Parsing RSS feed')
+    twelve_hours_ago = timedelta(hours=12)
+    now = datetime.now(timezone.utc)
+    releases = []
+    try:
+        for event, item in ElementTree.iterparse(http_response):
+            if item.tag != 'item':
+                continue
+            release = dict(
+                title=item.findtext('title', '').strip(),
+                link=item.findtext('link', '').strip(),
+                published=format_date(item.findtext('pubDate', '').strip()),
+                description=item.findtext('description', '')
+            )
+            # Only look at entries that were published in the last 12 hours
+            if (now - release['published']) >= twelve_hours_ago:
+                break
+            releases.append(RSSNewRelease(release))
+            item.clear()
+    finally:
+        # Discard the rest of the feed so the connection can be reused
+        http_response.drain_conn()
+        http_response.release_conn()
+    return releases, get_conditional_headers(http_response)
+
+
+def get_slacked_urls(releases):
+    """Returns the set of release urls that are already in the DDB
+    table. Urls found during earlier warm invocations are answered from
+    the local cache, and the rest are looked up with BatchGetItem rather
+    than issuing one query per release.
 
+    Keyword arguments:
+    releases -- A list of objects that contain information about the release
+    """
+    # BatchGetItem rejects duplicate keys in the same request
+    urls = list(dict.fromkeys(release.url for release in releases))
+    slacked_urls = {url for url in urls if url in slacked_urls_cache}
+    urls = [url for url in urls if url not in slacked_urls]
+    for i in range(0, len(urls), DDB_BATCH_GET_LIMIT):
+        logger.debug(f'Querying DDB for {len(urls[i:i + DDB_BATCH_GET_LIMIT])} urls')
+        request_items = {
+            DDB_TABLE: dict(
+                Keys=[{'url': {'S': url}}
+                      for url in urls[i:i + DDB_BATCH_GET_LIMIT]],
+                # Only the key is needed, and URL is a DynamoDB reserved word
+                ProjectionExpression='#url',
+                ExpressionAttributeNames={'#url': 'url'}
+            )
+        }
+        attempts = 0
+        while request_items and attempts < DDB_BATCH_MAX_ATTEMPTS:
+            if attempts:
+                ddb_backoff(attempts)
+            response = ddb_client.batch_get_item(RequestItems=request_items)
+            slacked_urls.update(
+                item['url']['S'] for item in response['Responses'].get(DDB_TABLE, []))
+            request_items = response['UnprocessedKeys']
+            attempts += 1
+        if request_items:
+            # Without an answer for every url, releases could be sent twice
+            logger.error(f'DDB did not process {len(request_items[DDB_TABLE]["Keys"])} '
+                         f'keys after {attempts} attempts')
+            raise RuntimeError('Unable to check which releases were already sent')
+    cache_slacked_urls(slacked_urls)
+    return slacked_urls
+
+
+def cache_slacked_urls(urls):
+    """Remembers urls that are in the DDB table so later warm invocations
+    don't need to look them up again. Once the cache is full the least
+    recently seen urls are dropped.
 
-def post_slack(slack_msg, urls, connection):
-    """Posts the message to Slack webhook endpoint"""
-    try:
-        logger.info(f'Posting to Slack: {slack_msg["text"]}')
-        for url in urls:
+    Keyword arguments:
+    urls -- The urls that are known to be in the DDB table
+    """
+    for url in urls:
+        slacked_urls_cache[url] = None
+        slacked_urls_cache.move_to_end(url)
+    while len(slacked_urls_cache) > SLACKED_URLS_CACHE_SIZE:
+        slacked_urls_cache.popitem(last=False)
+
+
+def post_slack(slack_msgs, url, connection):
+    """Posts each message, in order, to a Slack webhook endpoint and
+    returns the indexes of the messages that were not delivered.
+    This is run in its own thread for every webhook url.
+
+    Keyword arguments:
+    slack_msgs -- A list of (title, body) tuples where body is the
+                  message already serialized to JSON
+    url -- The Slack webhook url to post to
+    connection -- The urllib3 PoolManager shared by all threads
+    """
+    headers = {'Content-Type': 'application/json'}
+    failed = set()
+    for i, (title, body) in enumerate(slack_msgs):
+        try:
+            logger.info(f'Posting to Slack: {title}')
             post = connection.request(
                 'POST',
                 url,
-                body=json.dumps(slack_msg).encode('utf-8'),
-                headers={'Content-Type': 'application/json'}
+                body=body,
+                headers=headers,
+                retries=slack_retries
             )
-    except urllib3.exceptions.HTTPError as error:
-        logger.error(f'Problem posting release to slack: {error}')
+        except urllib3.exceptions.HTTPError as error:
+            logger.error(f'Problem posting release to slack: {error}')
+            failed.add(i)
+        else:
+            if not 200 <= post.status < 300:
+                logger.error(f'Problem posting release to slack: {post.status} '
+                             f'{post.data.decode("utf-8", "replace")}')
+                failed.add(i)
+    return failed
 
 
-def log_slack(release):
-    """Adds the new release entry to DynamoDB. This will serve
+def log_slack(releases):
+    """Adds the new release entries to DynamoDB. This will serve
     as both a history of all the releases that were sent
     and is also checked before each message is sent to avoid
-    sending duplicates.
+    sending duplicates. The entries are written with BatchWriteItem,
+    25 at a time, and any unprocessed items are retried with backoff
+    a limited number of times.
 
     Keyword arguments:
-    release -- An object that contains information about the release
+    releases -- A list of objects that contain information about the release
     """
-    ddb_client = boto3.client('dynamodb')
-    slack_date = datetime.now(timezone.utc).isoformat(' ').split('.')[0]
+    slack_date = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    put_requests = [
+        dict(PutRequest=dict(Item={
+            'url': {
+                'S': release.url
+            },
+            'title': {
+                'S': release.title
+            },
+            'pub_date': {
+                'S': release.published_date
+            },
+            'slack_date': {
+                'S': slack_date
+            }
+        }))
+        for release in releases
+    ]
+    unprocessed_urls = set()
     try:
-        response = ddb_client.put_item(TableName=DDB_TABLE,
-                                       Item={
-                                           'url': {
-                                               'S': release.url
-                                           },
-                                           'title': {
-                                               'S': release.title
-                                           },
-                                           'pub_date': {
-                                               'S': release.published_date
-                                           },
-                                           'slack_date': {
-                                               'S': slack_date
-                                           }
-                                       })
-        logger.info(f'Added {release} to DDB table')
-    except ClientError as error:
+        for i in range(0, len(put_requests), DDB_BATCH_WRITE_LIMIT):
+            request_items = {
+                DDB_TABLE: put_requests[i:i + DDB_BATCH_WRITE_LIMIT]
+            }
+            attempts = 0
+            while request_items and attempts < DDB_BATCH_MAX_ATTEMPTS:
+                if attempts:
+                    ddb_backoff(attempts)
+                response = ddb_client.batch_write_item(
+                    RequestItems=request_items)
+                request_items = response['UnprocessedItems']
+                attempts += 1
+            if request_items:
+                unprocessed_urls.update(
+                    put_request['PutRequest']['Item']['url']['S']
+                    for put_request in request_items[DDB_TABLE])
+        for release in releases:
+            if release.url in unprocessed_urls:
+                logger.error(f'Problem adding history to slack: {release} '
+                             f'was not processed after {DDB_BATCH_MAX_ATTEMPTS} attempts')
+            else:
+                logger.info(f'Added {release} to DDB table')
+    except (BotoCoreError, ClientError) as error:
         logger.error(f'Problem adding history to slack: {error}')
+    # The releases were posted either way, so at least this environment
+    # shouldn't send them again
+    cache_slacked_urls(release.url for release in releases)
+
+
+def ddb_backoff(attempts):
+    """Sleeps before a batch call asks DynamoDB again for the items it
+    did not process, doubling the delay on each retry.
+
+    Keyword arguments:
+    attempts -- The number of requests already made for the batch
+    """
+    time.sleep(min(DDB_RETRY_BASE_DELAY * 2 ** (attempts - 1),
+                   DDB_RETRY_MAX_DELAY))
 
 
 def get_webhook_urls():
     """Retrieves the Slack Webhook URLs that are stored in Secrets Manager.
     Uses the AWS Secrets Manager caching library to cache locally
     so each invocation doesn't need to perform a GetSecretValue call.
+    The parsed urls are also kept for the same amount of time so warm
+    invocations skip the cache lookup and JSON decoding.
     """
+    now = time.monotonic()
+    if now < webhook_urls_cache['expires']:
+        return webhook_urls_cache['urls']
     logger.info('Getting Slack webhook URL(s) from AWS Secrets Manager')
     try:
         # If not already in cache, keep urls in cache for 4 hours before re-calling
-        secret_urls = parameters.get_secret(WEBHOOK_SECRET_NAME, max_age=14400)
+        secret_urls = parameters.get_secret(
+            WEBHOOK_SECRET_NAME, max_age=WEBHOOK_URLS_MAX_AGE)
         slack_urls = json.loads(secret_urls)
     except parameters.exceptions.GetParameterError as error:
         logger.error(f'Problem getting the Slack Webhook URLs: {error}')
@@ -210,63 +414,152 @@ def get_webhook_urls():
         logger.error(f'Problem decoding JSON: {error}')
         raise
     else:
+        webhook_urls_cache.update(
+            expires=now + WEBHOOK_URLS_MAX_AGE, urls=slack_urls['urls'])
         return slack_urls['urls']
 
 
+def send_releases(releases):
+    """Posts the new releases to every Slack webhook and then records
+    the ones every webhook accepted in the DDB table. Releases that
+    weren't delivered are left out so the next run sends them again.
+    Returns True if every release was delivered.
+
+    Keyword arguments:
+    releases -- A list of objects that contain information about the release
+    """
+    slack_webhook_urls = get_webhook_urls()
+    # Serialize each message once and share it across all webhooks
+    slack_msgs = [
+        (release.title, json.dumps(release.in_slack_format()).encode('utf-8'))
+        for release in releases
+    ]
+    # Post to each webhook concurrently, keeping release order per channel
+    with ThreadPoolExecutor(
+            max_workers=min(SLACK_MAX_WORKERS, len(slack_webhook_urls)) or 1) as executor:
+        posts = [executor.submit(post_slack, slack_msgs, url, http_connection)
+                 for url in slack_webhook_urls]
+        failed = set()
+        for post in posts:
+            failed.update(post.result())
+    if failed:
+        logger.error(f'{len(failed)} releases were not delivered to every '
+                     'webhook and will be sent again on the next run')
+    delivered = [release for i, release in enumerate(releases) if i not in failed]
+    if delivered:
+        log_slack(delivered)
+    return not failed
+
+
+def get_conditional_headers(http_response):
+    """Returns the request headers that make the next request for the
+    same url return 304 Not Modified if the content hasn't changed.
+
+    Keyword arguments:
+    http_response -- The urllib3 response to take the validators from
+    """
+    headers = {}
+    if 'ETag' in http_response.headers:
+        headers['If-None-Match'] = http_response.headers['ETag']
+    if 'Last-Modified' in http_response.headers:
+        headers['If-Modified-Since'] = http_response.headers['Last-Modified']
+    return headers
+
+
+def strip_html(html_text):
+    """Returns the plain text of an HTML fragment. The release summaries
+    are short snippets of markup, so removing the tags and unescaping
+    the entities is all that's needed.
+
+    Keyword arguments:
+    html_text -- The HTML fragment to convert
+    """
+    return html.unescape(HTML_TAG_PATTERN.sub('', html_text)).strip()
+
+
 def format_date(date_string):
-    return datetime.strptime(date_string, '%a, %d %b %Y %H:%M:%S %z')
+    """Parses an RFC 822 date from the RSS feed into a timezone aware
+    datetime. parsedate_to_datetime avoids the locale lookups strptime
+    does for the day and month names.
+
+    Keyword arguments:
+    date_string -- The pubDate of an item in the RSS feed
+    """
+    published_date = parsedate_to_datetime(date_string)
+    if published_date.tzinfo is None:
+        # A -0000 offset parses as naive but the time is still UTC
+        published_date = published_date.replace(tzinfo=timezone.utc)
+    return published_date
 
 
-@tracer.capture_lambda_handler
+@tracer.capture_lambda_handler(capture_response=False)
 def main(event, context):
     """Iterates over each new release and checks if the URL is already
     in the DynamoDB history table. If not, creates a slack message
     and posts it. Otherwise, the release is ignored and is assumed to
     have already been sent.
     """
-    http_connection = urllib3.PoolManager()
+    if event.get('warmer'):
+        logger.debug('Warmer invocation, nothing to do')
+        return
+
     try:
         # Gets the latest 25 releases from the search API
         logger.info('Getting releases from search API')
-        http_response = http_connection.request('GET', WHATS_NEW_SEARCH_API)
-        items = json.loads(http_response.data.decode('utf-8'))['items']
+        http_response = http_connection.request(
+            'GET', WHATS_NEW_SEARCH_API,
+            headers=conditional_headers.get(WHATS_NEW_SEARCH_API, {}))
+        if http_response.status == 304:
+            logger.info('Search API results have not changed since the last run')
+            return
+        items = json.loads(http_response.data)['items']
         releases = [APINewRelease(item['item']) for item in reversed(items)]
+        source_url = WHATS_NEW_SEARCH_API
+        next_headers = get_conditional_headers(http_response)
     except Exception as error:
         # Fall back to RSS feed if search API fails
         logger.warn(f'Problem getting releases from search API: {error}')
         logger.info('Falling back to RSS feed')
         try:
-            items = feedparser.parse(WHATS_NEW_RSS_FEED)
-            logger.info('Parsing RSS feed')
-            twelve_hours_ago = timedelta(hours=12)
-            now = datetime.now(timezone.utc)
-            # Only look at entries that were published 12 hours ago
-            releases = [RSSNewRelease(item) for item in items['entries'] if (
-                now - format_date(item['published'])) < twelve_hours_ago]
+            rss_releases = get_rss_releases()
         except Exception as error:
             logger.error(f'Problem getting RSS feed: {error}')
             raise
+        if rss_releases is None:
+            logger.info('RSS feed has not changed since the last run')
+            return
+        releases, next_headers = rss_releases
+        source_url = WHATS_NEW_RSS_FEED
 
     """Iterate over the releases, check if each has been sent, and send 
     to Slack webhook URL if it's new.
     """
-    logger.debug('Releases received', extra={
-        'releases': [r for r in releases]})
-    slack_webhook_urls = get_webhook_urls()
+    logger.debug('Releases received', extra={'releases': releases})
+    slacked_urls = get_slacked_urls(releases)
+    new_releases = []
     logger.info('Checking each release')
     for release in releases:
-        if has_been_slacked(release.url):
+        if release.url in slacked_urls:
             logger.debug('Already sent link to slack',
                          extra={'title': release})
             continue
         else:
             logger.debug('Found release to send to slack')
-            post_slack(
-                release.in_slack_format(),
-                slack_webhook_urls,
-                http_connection
-            )
-            log_slack(release)
+            new_releases.append(release)
+            slacked_urls.add(release.url)
+
+    delivered = True
+    if new_releases:
+        delivered = send_releases(new_releases)
+    else:
+        # Most invocations find nothing new, so the webhook urls aren't fetched
+        logger.info('No new releases to send')
+
+    # Once every release in the response was handled, an unchanged
+    # response can be skipped next time. Otherwise the next run needs the
+    # full response to send the releases that weren't delivered.
+    if delivered:
+        conditional_headers[source_url] = next_headers
 
     logger.info('Done!')
     return